@@ -9,20 +9,39 @@ import select
 import termios
 import tty
 import asyncio
+from collections import deque
 from pathlib import Path
 from typing import Optional
 from rich.text import Text
 from textual.app import App
 from textual.widgets import DataTable, Footer, Input, Button
+from textual.widgets.data_table import ColumnKey, RowKey
 from textual.widgets import RichLog as _RichLog
 from textual.containers import Horizontal
 from textual.reactive import reactive
 import re
 import time
 from datetime import datetime
-from .backend import OrchestratorBackend, load_config, format_duration, State, Kind
+from .backend import OrchestratorBackend, load_config, format_duration, State, STATE_GLYPH, Kind
 
 _ANSI_ESCAPE = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
+# str.translate table deleting C0/C1 control characters (keeps tab and newline)
+_DROP_TABLE = dict.fromkeys([*range(0, 9), *range(11, 32), 127, *range(128, 160)])
+# Any character _DROP_TABLE would delete (ESC included, so also any ANSI sequence)
+_CTRL_RE = re.compile(r'[\x00-\x08\x0B-\x1F\x7F-\x9F]')
+# Upper bound on queued lines coalesced into a single log write
+_LOG_BATCH_MAX = 200
+# Parsed log line: (task label, content-only Text, label-prefixed styled Text)
+_LogEntry = tuple[str, Text, Text]
+# Parsed batches allowed to wait for the UI before the processor backs off
+_RENDER_QUEUE_MAX = 32
+# State cell colouring in the task table
+_STATE_STYLES = {
+    State.PENDING: "grey50",
+    State.RUNNING: "yellow",
+    State.READY: "green",
+    State.FAILED: "red",
+}
 
 # Custom RichLog subclass that toggles auto_scroll based on user scrolls
 class LogView(_RichLog):
@@ -86,20 +105,29 @@ class OrchApp(App):
         self.config = config
         self.backend: OrchestratorBackend
         self.tasks: list[str] = []
-        # Store all logs for filtering
-        self.all_logs: list[str] = []
-        # (No initial suppression; allow selecting tasks immediately)
-        # Suppress row highlight events during programmatic updates
-        self._suppress_row_highlight = False
-        # (unused) flag to suppress first highlight after show-all
-        self._ignore_next_row_highlight = False
+        # Stable task table row/column keys and last rendered (icon, style, duration)
+        self._row_keys: dict[str, RowKey] = {}
+        self._state_col: ColumnKey
+        self._time_col: ColumnKey
+        self._last_cell: dict[str, tuple[str, str, str]] = {}
+        # Per-task log prefix "[name   ]", its styled span length and colour
+        self._label_cache: dict[str, tuple[str, int, str]] = {}
+        # Parsed logs in arrival order (for "All") and per task (for filtering)
+        self.all_logs: deque[_LogEntry] = deque()
+        self.logs_by_task: dict[str, deque[_LogEntry]] = {}
         # Background task references for clean shutdown
         self._backend_task: asyncio.Task | None = None
         self._log_watcher_task: asyncio.Task | None = None
+        self._log_processor_task: asyncio.Task | None = None
+        self._state_watcher_task: asyncio.Task | None = None
+        # Parsed/styled log batches handed from the processor to the watcher
+        self._render_queue: asyncio.Queue[list[_LogEntry]] = asyncio.Queue(maxsize=_RENDER_QUEUE_MAX)
         # Timestamping: track last log time for periodic timestamps
         self._last_log_time: float | None = None
         # Seconds between timestamp inserts (interval for time-only stamps)
         self._timestamp_interval: float = 60.0
+        # Last formatted stamp as (epoch second, format, text)
+        self._ts_cache: tuple[int, str, str] | None = None
 
     async def on_mount(self) -> None:
         """
@@ -110,25 +138,44 @@ class OrchApp(App):
         """
         # Load configuration and start backend
         cfgs, default_max_lines = load_config(self.config)
-        self.default_max_lines = default_max_lines
-        self.backend = OrchestratorBackend(cfgs)
+        self.backend = OrchestratorBackend(cfgs, default_max_lines)
         # Add meta task at index 0 for showing all logs
         self.tasks = ["All"] + list(self.backend.rt.keys())
         # Precompute max label width for log alignment
         self.max_label_len = max(len(name) for name in self.tasks)
+        label_len = self.max_label_len
+        self._label_cache = {
+            name: (f"[{name.ljust(label_len)}]", label_len + 2, tr.colour)
+            for name, tr in self.backend.rt.items()
+        }
+        # Ring buffers: appends stay O(1) and the oldest lines drop automatically
+        self.all_logs = deque(maxlen=self.backend.default_max_lines)
+        self.logs_by_task = {
+            name: deque(maxlen=tr.cfg.max_lines) for name, tr in self.backend.rt.items()
+        }
 
         # Set up task table
         self.table = DataTable(zebra_stripes=True, name="task_table")
         # Highlight entire rows
         self.table.cursor_type = "row"
-        self.table.add_columns("#", "Task", "State", "Deps", "Time")
+        _, _, self._state_col, _, self._time_col = self.table.add_columns(
+            "#", "Task", "State", "Deps", "Time"
+        )
+        # Rows are added once and keyed by task name; refresh_tasks only
+        # updates the cells that change, so the cursor stays on its row
         for idx, name in enumerate(self.tasks):
             if idx == 0:
-                # Meta task row: no state, deps, or time
+                # Meta task row: no state, deps, or time; auto key so it can
+                # never collide with a task name
                 self.table.add_row(str(idx), name, "", "", "")
             else:
-                deps = ", ".join(self.backend.rt[name].cfg.depends_on)
-                self.table.add_row(str(idx), name, "", deps, "")
+                tr = self.backend.rt[name]
+                # Color the task name cell
+                task_cell = Text(name, style=tr.colour)
+                deps = ", ".join(tr.cfg.depends_on)
+                self._row_keys[name] = self.table.add_row(
+                    str(idx), task_cell, "", deps, "", key=name
+                )
 
         # Set up log view
         # Give a custom name to avoid clashing with App.log property
@@ -139,7 +186,7 @@ class OrchApp(App):
             highlight=False,
             markup=False,
             name="log_view",
-            max_lines=self.default_max_lines,
+            max_lines=self.backend.default_max_lines,
         )
         self.log_view.auto_scroll = True
 
@@ -159,122 +206,166 @@ class OrchApp(App):
         await self.mount(self.stdin_container)
         await self.mount(Footer())
 
-        # Start backend run and log watcher, store tasks for shutdown
+        # Start backend run, log processor and log watcher, store tasks for shutdown
         self._backend_task = asyncio.create_task(self.backend.run())
+        self._log_processor_task = asyncio.create_task(self._process_logs())
         self._log_watcher_task = asyncio.create_task(self._watch_logs())
-        # Refresh table periodically
-        self.set_interval(0.5, self.refresh_tasks)
+        # Refresh table whenever the backend reports a state change
+        self._state_watcher_task = asyncio.create_task(self._watch_state())
         # Focus the table for navigation
         self.set_focus(self.table)
 
+    async def _process_logs(self) -> None:
+        """
+        Parses raw backend log lines into renderable entries.
+
+        Pulls `(task, lines)` batches from the backend's log queue, strips ANSI
+        and control codes, and builds both renderables for each line (the
+        content-only Text and the label-prefixed all-tasks Text).
+        Finished batches are handed to `_watch_logs` through a small bounded
+        queue, so this work stays out of the coroutine that writes to the log
+        view.
+        """
+        queue = self.backend.log_queue
+        # Bind per-line lookups once; this loop runs for every output line
+        ansi_sub = _ANSI_ESCAPE.sub
+        ctrl_search = _CTRL_RE.search
+        label_lookup = self._label_cache.get
+        while True:
+            # Wait for one batch, then drain whatever else is already queued so
+            # a burst of output costs a single write/render
+            batches = [await queue.get()]
+            count = len(batches[0][1])
+            try:
+                while count < _LOG_BATCH_MAX:
+                    batch = queue.get_nowait()
+                    batches.append(batch)
+                    count += len(batch[1])
+            except asyncio.QueueEmpty:
+                pass
+            entries: list[_LogEntry] = []
+            for label, lines in batches:
+                # All-tasks rendering: label padded and colored
+                cached = label_lookup(label)
+                if cached is not None:
+                    prefix, span, colour = cached
+                else:
+                    prefix, span, colour = f"[{label.ljust(self.max_label_len)}]", 0, ""
+                for raw_line in lines:
+                    # Most lines are plain text: only clean those with control bytes
+                    if ctrl_search(raw_line) is None:
+                        rest = raw_line
+                    else:
+                        # Remove ANSI escape sequences, then remaining control characters
+                        rest = ansi_sub('', raw_line).translate(_DROP_TABLE)
+                    txt = Text(prefix + rest)
+                    if span:
+                        txt.stylize(colour, 0, span)
+                    entries.append((label, Text(rest), txt))
+            await self._render_queue.put(entries)
+
     async def _watch_logs(self) -> None:
         """
-        Watches for new log entries and updates the log view.
+        Watches for processed log batches and updates the log view.
 
-        Continuously pulls log entries from the backend's log queue, stores them,
-        and writes them to the log view. Inserts a full date/time stamp at the
-        first log and time-only stamps periodically. In all-tasks mode, logs are
-        prefixed with a colored task label; in single-task mode, labels are
-        omitted and only content is shown.
+        Pulls batches produced by `_process_logs`, stores them, and writes the
+        ones matching the current filter to the log view in a single write.
+        Inserts a full date/time stamp at the first log and time-only stamps
+        periodically. In all-tasks mode, logs are prefixed with a colored task
+        label; in single-task mode, labels are omitted and only content is shown.
         """
+        render_queue = self._render_queue
         while True:
-            # Pull raw log line from backend, strip ANSI and control codes
-            raw_line = await self.backend.log_queue.get()
-            # Remove ANSI escape sequences
-            clean = _ANSI_ESCAPE.sub('', raw_line)
-            # Remove any remaining non-printable/control characters
-            line = ''.join(ch for ch in clean if ch.isprintable() or ch.isspace())
-            # record every log line (trim oldest beyond max)
-            # record every log line (drop oldest beyond default max)
-            self.all_logs.append(line)
-            if len(self.all_logs) > self.default_max_lines:
-                del self.all_logs[0]
-            # Only process if matches current filter (or show all)
-            if self.filter_task is None or line.startswith(f"[{self.filter_task}]"):
-                # Timestamp insertion: initial full date/time or time-only after interval
-                now_ts = time.time()
-                if (self._last_log_time is None) or (now_ts - self._last_log_time >= self._timestamp_interval):
-                    # Full timestamp on first log, then time-only
-                    if self._last_log_time is None:
-                        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # Coalesce every batch the processor has ready into one write
+            entries = await render_queue.get()
+            try:
+                while True:
+                    entries += render_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            parts: list[Text] = []
+            for entry in entries:
+                label, content, txt = entry
+                # record every log line (deques drop the oldest beyond max)
+                self.all_logs.append(entry)
+                task_logs = self.logs_by_task.get(label)
+                if task_logs is not None:
+                    task_logs.append(entry)
+                # Only process if matches current filter (or show all)
+                if self.filter_task is None or label == self.filter_task:
+                    # Timestamp insertion: initial full date/time or time-only after interval
+                    now_ts = time.time()
+                    if (self._last_log_time is None) or (now_ts - self._last_log_time >= self._timestamp_interval):
+                        # Full timestamp on first log, then time-only
+                        if self._last_log_time is None:
+                            stamp = self._format_stamp(now_ts, "%Y-%m-%d %H:%M:%S")
+                        else:
+                            stamp = self._format_stamp(now_ts, "%H:%M:%S")
+                        parts.append(Text(stamp, style="bold dim"))
+                        self._last_log_time = now_ts
+                    if self.filter_task is None:
+                        parts.append(txt)
                     else:
-                        stamp = datetime.now().strftime("%H:%M:%S")
-                    ts_txt = Text(stamp, style="bold dim")
-                    self.log_view.write(ts_txt)
-                    self._last_log_time = now_ts
-                # Preserve scroll position
-                offset_y = self.log_view.scroll_offset.y
-                max_y = self.log_view.max_scroll_y
-                at_bottom = (offset_y >= max_y)
-                # Determine label and content
-                end = line.find("]")
-                if end != -1:
-                    label = line[1:end]
-                    rest = line[end+1:]
-                else:
-                    label = None
-                    rest = line
-                # Render line depending on filter mode
-                if self.filter_task is None:
-                    # All tasks: show label padded and colored
-                    padded = (label or "").ljust(self.max_label_len)
-                    full = f"[{padded}]{rest}"
-                    txt = Text(full)
-                    if label and label in self.backend.rt:
-                        txt.stylize(self.backend.rt[label].colour, 0, len(padded) + 2)
-                else:
-                    # Single-task mode: only show content, no label prefix
-                    txt = Text(rest)
-                self.log_view.write(txt)
-                # auto-scroll is managed by RichLog.auto_scroll
+                        # Single-task mode: only show content, no label prefix
+                        parts.append(content)
+            # One write per batch; auto-scroll is managed by RichLog.auto_scroll
+            if parts:
+                self.log_view.write(Text("\n").join(parts))
+
+    def _format_stamp(self, now_ts: float, fmt: str) -> str:
+        """Formats a timestamp, reusing the last result within the same second."""
+        sec = int(now_ts)
+        cache = self._ts_cache
+        if cache is not None and cache[0] == sec and cache[1] == fmt:
+            return cache[2]
+        stamp = datetime.fromtimestamp(sec).strftime(fmt)
+        self._ts_cache = (sec, fmt, stamp)
+        return stamp
+
+    async def _watch_state(self) -> None:
+        """
+        Refreshes the task table each time the backend marks state dirty.
+
+        Changes that land while a refresh is pending are folded into a single
+        refresh; an idle backend costs nothing.
+        """
+        dirty = self.backend.dirty
+        self.refresh_tasks()
+        while True:
+            await dirty.wait()
+            dirty.clear()
+            self.refresh_tasks()
 
     def refresh_tasks(self) -> None:
         """
         Refreshes the task table with the latest status.
 
-        This method is called periodically to update the task table with the
-        latest state, duration, and other information from the backend.
+        This method is called on backend state changes to update the task
+        table with the latest state and duration. Rows are never rebuilt;
+        only cells whose rendered value changed since the last call are updated.
         """
-        # Preserve current selection and suppress highlights during update
-        prev_row = self.selected_row
-        self._suppress_row_highlight = True
-        # Clear existing rows (headers remain)
-        self.table.clear()
-        # Build style map for state coloring
-        style_map = {
-            State.PENDING: "grey50",
-            State.RUNNING: "yellow",
-            State.READY: "green",
-            State.FAILED: "red",
-        }
-        for idx, name in enumerate(self.tasks):
-            if idx == 0:
-                # Meta task row
-                self.table.add_row(str(idx), name, "", "", "")
+        for name in self.tasks[1:]:
+            tr = self.backend.rt[name]
+            # Determine icon: checkmark if completed tasks, else state symbol
+            if tr.state is State.READY and tr.end_time > 0:
+                icon = "✓"
             else:
-                tr = self.backend.rt[name]
-                # Color the task name cell
-                task_cell = Text(name, style=tr.colour)
-                # Determine icon: checkmark if completed tasks, else state symbol
-                if tr.state is State.READY and tr.end_time > 0:
-                    icon = "✓"
-                else:
-                    icon = tr.state.value
-                state_cell = Text(icon, style=style_map.get(tr.state, ""))
-                deps = ", ".join(tr.cfg.depends_on)
-                if tr.start_time and tr.end_time:
-                    duration = format_duration(tr.end_time - tr.start_time)
-                else:
-                    duration = ""
-                self.table.add_row(str(idx), task_cell, state_cell, deps, duration)
-        # Restore cursor to previous row, if valid
-        if 0 <= prev_row < len(self.tasks):
-            try:
-                self.table.cursor_coordinate = (prev_row, 0)
-            except Exception:
-                pass
-        # Re-enable highlight handling
-        self._suppress_row_highlight = False
+                icon = STATE_GLYPH[tr.state]
+            style = _STATE_STYLES.get(tr.state, "")
+            if tr.start_time and tr.end_time:
+                duration = format_duration(tr.end_time - tr.start_time)
+            else:
+                duration = ""
+            # Touch only the cells whose rendered value changed
+            prev = self._last_cell.get(name)
+            if prev == (icon, style, duration):
+                continue
+            row_key = self._row_keys[name]
+            if prev is None or prev[:2] != (icon, style):
+                self.table.update_cell(row_key, self._state_col, Text(icon, style=style))
+            if prev is None or prev[2] != duration:
+                self.table.update_cell(row_key, self._time_col, duration, update_width=True)
+            self._last_cell[name] = (icon, style, duration)
 
     def action_quit(self) -> None:
         """
@@ -301,6 +392,10 @@ class OrchApp(App):
         # Cancel background tasks
         if self._log_watcher_task:
             self._log_watcher_task.cancel()
+        if self._log_processor_task:
+            self._log_processor_task.cancel()
+        if self._state_watcher_task:
+            self._state_watcher_task.cancel()
         if self._backend_task:
             self._backend_task.cancel()
         # Close any open PTY masters
@@ -331,7 +426,7 @@ class OrchApp(App):
         """
         # Adjust log view max_lines per current task (default or per-task)
         if new is None or new == "All":
-            self.log_view.max_lines = self.default_max_lines
+            self.log_view.max_lines = self.backend.default_max_lines
         else:
             task_rt = self.backend.rt.get(new)
             if task_rt:
@@ -348,33 +443,22 @@ class OrchApp(App):
 
         # Clear view and render header if in single-task mode
         self.log_view.clear()
+        parts: list[Text] = []
         if new is not None and new != "All":
             # Show task title as header in its color
             colour = self.backend.rt.get(new).colour if self.backend.rt.get(new) else ""
-            header = Text(f"=== {new} ===", style=f"bold {colour}")
-            self.log_view.write(header)
+            parts.append(Text(f"=== {new} ===", style=f"bold {colour}"))
             # Blank line after header
-            self.log_view.write(Text(""))
-        # Render all matching logs
-        filtered = [ln for ln in self.all_logs if new is None or ln.startswith(f"[{new}]")]
-        for ln in filtered:
-            end = ln.find("]")
-            if end != -1:
-                label = ln[1:end]
-                rest = ln[end+1:]
-                if new is None:
-                    # All tasks: show label padded and colored
-                    padded = label.ljust(self.max_label_len)
-                    full = f"[{padded}]{rest}"
-                    txt = Text(full)
-                    if label in self.backend.rt:
-                        txt.stylize(self.backend.rt[label].colour, 0, len(padded) + 2)
-                else:
-                    # Single-task: only content, no label prefix
-                    txt = Text(rest)
-            else:
-                txt = Text(ln)
-            self.log_view.write(txt)
+            parts.append(Text(""))
+        # Render all matching logs from the pre-parsed history
+        if new is None:
+            parts.extend(txt for _label, _content, txt in self.all_logs)
+        else:
+            # Single-task: only content, no label prefix
+            parts.extend(content for _label, content, _txt in self.logs_by_task.get(new, ()))
+        # One write for the whole replay (Text.join keeps each line's spans)
+        if parts:
+            self.log_view.write(Text("\n").join(parts))
         # (Removed unconditional auto-scroll here to respect manual scrolling)
 
 
@@ -423,12 +507,11 @@ class OrchApp(App):
                 # Add a newline to simulate pressing enter
                 data_to_send = (content + "\n").encode()
                 try:
-                    loop = asyncio.get_running_loop()
-                    await loop.run_in_executor(None, os.write, task_rt.pty_primary, data_to_send)
+                    self.backend.write_stdin(task_rt, data_to_send)
                     self.stdin_input.value = "" # Clear input after sending
                     self.stdin_input.focus() # Refocus input
                 except Exception as e:
-                    await self.backend.log_queue.put(f"[App] Error writing to {task_name}: {e}")
+                    await self.backend.log_queue.put(("App", [f" Error writing to {task_name}: {e}"]))
 
 
     async def on_data_table_row_highlighted(self, message: DataTable.RowHighlighted) -> None:
@@ -442,22 +525,15 @@ class OrchApp(App):
         Args:
             message: The row highlight event.
         """
-        # Handle user-driven row-highlight events
+        # Rows are never rebuilt, so every highlight is a genuine cursor move
         row = message.cursor_row
-        # ignore updates during table refresh
-        if self._suppress_row_highlight:
-            return
         # ignore repeated highlight events without row change
         if row == self.selected_row:
             return
-        # genuine selection: update filter based on selected row (0 = all)
         self.selected_row = row
-        if row == 0:
-            self.filter_task = None
-        elif 0 < row < len(self.tasks):
-            self.filter_task = self.tasks[row]
-        else:
-            self.filter_task = None
+        # Task rows are keyed by name; the "All" row's key matches no task
+        name = message.row_key.value
+        self.filter_task = name if name in self.backend.rt else None
 
 
 def _generate_sample_toml() -> str:
@@ -2,12 +2,17 @@
 """
 Backend orchestrator: spawn tasks as PTY-backed subprocesses, manage dependencies,
 emit logs and state changes via an asyncio.Queue.
+
+Log queue items are `(task name, lines)` batches; each line is the text that
+follows the task's `[name]` label.
 """
 from __future__ import annotations
 import asyncio
 import dataclasses as dc
 import enum
 import os
+import re
+import shlex
 import signal
 import time
 import pty
@@ -23,6 +28,21 @@ except ModuleNotFoundError:
 READY_TIMEOUT = 30
 # Default maximum log lines to retain if not specified in config
 DEFAULT_MAX_LINES = 2000
+# Bytes per PTY read, and reads per readiness callback before yielding to the loop
+PTY_READ_SIZE = 65536
+PTY_READS_PER_WAKE = 16
+# Longest partial line held back waiting for a newline (e.g. \r-only progress
+# output) before it is flushed as-is
+PTY_LINE_LIMIT = 65536
+# Quiet period after which a held-back partial line (e.g. a prompt) is shown
+PTY_IDLE_FLUSH = 0.05
+# Queued log batches before producers wait (backpressure on noisy tasks)
+LOG_QUEUE_MAX = 4096
+# Readiness probe polling: first retry delay, doubling up to the maximum
+PROBE_INTERVAL_MIN = 0.25
+PROBE_INTERVAL_MAX = 1.0
+# Characters that need /bin/bash to interpret a ready_cmd
+_SHELL_META = re.compile(r"[;&|<>$`*?~!#(){}\[\]\n]")
 TAB10 = [
     "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
     "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
@@ -65,11 +85,19 @@ class Kind(str, enum.Enum):
     SERVICE = "service"
     DAEMON = "daemon"
 
-class State(str, enum.Enum):
-    PENDING = "□"
-    RUNNING = "●"
-    READY = "■"
-    FAILED = "✖"
+class State(enum.IntEnum):
+    PENDING = 0
+    RUNNING = 1
+    READY = 2
+    FAILED = 3
+
+# Display symbol for each state
+STATE_GLYPH = {
+    State.PENDING: "□",
+    State.RUNNING: "●",
+    State.READY: "■",
+    State.FAILED: "✖",
+}
 
 @dc.dataclass(slots=True)
 class TaskCfg:
@@ -99,6 +127,8 @@ class TaskRt:
     end_time: float = 0.0
     pty_primary: int = -1
     pty_secondary: int = -1
+    # Input not yet accepted by the (non-blocking) PTY primary
+    stdin_pending: bytearray = dc.field(default_factory=bytearray)
 
 def load_config(path: Path) -> tuple[dict[str, TaskCfg], int]:
     raw = tomllib.loads(path.read_text())
@@ -116,30 +146,50 @@ def load_config(path: Path) -> tuple[dict[str, TaskCfg], int]:
             cmd = f"{prefix_cmd} && {cmd}"
         task_ready_timeout = float(row.get("ready_timeout", def_ready_timeout))
         task_max_lines = int(row.get("max_lines", def_max_lines))
+        # Only resolve explicit workdirs; the default is resolved once above
+        wd_raw = row.get("workdir")
+        wd = def_wd if wd_raw is None else Path(wd_raw).expanduser().resolve()
         out[row.get("name", "")] = TaskCfg(
             name=row.get("name", ""),
             kind=Kind(row.get("kind", "oneshot")),
             cmd=cmd,
             depends_on=row.get("depends_on", []),
             ready_cmd=row.get("ready_cmd"),
-            workdir=Path(row.get("workdir", def_wd)).expanduser().resolve(),
+            workdir=wd,
             ready_timeout=task_ready_timeout,
             max_lines=task_max_lines,
         )
     return out, def_max_lines
 
+def _probe_argv(cmd: str) -> list[str] | None:
+    """Split a ready_cmd for direct exec, or None if it needs a shell."""
+    if _SHELL_META.search(cmd):
+        return None
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    # Leading VAR=value assignments are shell syntax too
+    if not argv or "=" in argv[0]:
+        return None
+    return argv
+
 def topo_order(cfgs: dict[str, TaskCfg]) -> list[str]:
-    indeg = {n: len(c.depends_on) for n, c in cfgs.items()}
-    child: dict[str, list[str]] = {}
-    for c in cfgs.values():
+    # One pass over the edges; every task gets its child list up front
+    indeg: dict[str, int] = {}
+    child: dict[str, list[str]] = {n: [] for n in cfgs}
+    for n, c in cfgs.items():
+        indeg[n] = len(c.depends_on)
         for d in c.depends_on:
-            child.setdefault(d, []).append(c.name)
+            if d not in child:
+                raise ValueError(f"unknown dependency {d!r} for task {n!r}")
+            child[d].append(n)
     q = deque(n for n, d in indeg.items() if d == 0)
     order: list[str] = []
     while q:
         n = q.popleft()
         order.append(n)
-        for ch in child.get(n, []):
+        for ch in child[n]:
             indeg[ch] -= 1
             if indeg[ch] == 0:
                 q.append(ch)
@@ -149,25 +199,33 @@ def topo_order(cfgs: dict[str, TaskCfg]) -> list[str]:
 
 class OrchestratorBackend:
     """Core orchestrator without UI dependencies."""
-    def __init__(self, cfgs: dict[str, TaskCfg]) -> None:
+    def __init__(self, cfgs: dict[str, TaskCfg], default_max_lines: int = DEFAULT_MAX_LINES) -> None:
+        # Log lines to retain for the combined (all-tasks) view
+        self.default_max_lines = default_max_lines
         self.rt: dict[str, TaskRt] = {}
         for idx, (n, cfg) in enumerate(cfgs.items()):
             tr = TaskRt(cfg=cfg)
             tr.colour = TAB10[idx % len(TAB10)]
             self.rt[n] = tr
-        self.log_queue: asyncio.Queue[str] = asyncio.Queue()
+        self.log_queue: asyncio.Queue[tuple[str, list[str]]] = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+        # Set whenever a task's state or end time changes; consumers clear it
+        self.dirty = asyncio.Event()
 
     async def run(self) -> None:
         order = topo_order({n: tr.cfg for n, tr in self.rt.items()})
         runners = [asyncio.create_task(self._run_task(self.rt[n])) for n in order]
         await asyncio.gather(*runners)
 
+    def _set_state(self, tr: TaskRt, state: State) -> None:
+        tr.state = state
+        self.dirty.set()
+
     async def _run_task(self, tr: TaskRt) -> None:
         # wait for dependencies
         await asyncio.gather(*(self.rt[d].ready.wait() for d in tr.cfg.depends_on))
-        tr.state = State.RUNNING
         tr.start_time = time.monotonic()
-        await self.log_queue.put(f"[{tr.cfg.name}] started")
+        self._set_state(tr, State.RUNNING)
+        await self.log_queue.put((tr.cfg.name, [" started"]))
         primary_fd, secondary_fd = pty.openpty()
         tr.pty_primary = primary_fd
         tr.pty_secondary = secondary_fd
@@ -185,56 +243,176 @@ class OrchestratorBackend:
         except Exception:
             pass
 
-        async def pump() -> None:
-            loop = asyncio.get_running_loop()
-            while True:
+        # Drain the PTY from the event loop: the callback runs only when the
+        # primary side is readable and keeps any partial trailing line
+        loop = asyncio.get_running_loop()
+        os.set_blocking(primary_fd, False)
+        pending = bytearray()
+        # Holds the put that is waiting for queue space while reading is paused
+        resume_task: asyncio.Task | None = None
+
+        # Pending call that shows the partial tail if the PTY goes quiet
+        idle_flush: asyncio.TimerHandle | None = None
+
+        def paused() -> bool:
+            # A batch is still waiting for queue space; nothing may overtake it
+            return resume_task is not None and not resume_task.done()
+
+        async def resume(item: tuple[str, list[str]], reattach: bool) -> None:
+            nonlocal idle_flush
+            await self.log_queue.put(item)
+            # The UI closes the PTY (and resets pty_primary) on quit
+            if reattach and tr.pty_primary >= 0:
+                loop.add_reader(primary_fd, on_readable)
+                # A tail held back while paused still needs its idle flush
+                if pending:
+                    idle_flush = loop.call_later(PTY_IDLE_FLUSH, flush_tail)
+
+        def emit(end: int, eof: bool) -> None:
+            nonlocal resume_task
+            text = pending[:end].decode(errors="replace")
+            del pending[:end]
+            lines = [f" │ {line}" for line in text.splitlines()]
+            if not lines:
+                return
+            item = (tr.cfg.name, lines)
+            try:
+                self.log_queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Stop draining until the consumer catches up; the PTY
+                # buffer then fills and the child blocks on write
+                if not eof:
+                    loop.remove_reader(primary_fd)
+                resume_task = asyncio.create_task(resume(item, not eof))
+
+        def flush_tail() -> None:
+            nonlocal idle_flush
+            idle_flush = None
+            if pending and not paused():
+                emit(len(pending), False)
+
+        def on_readable() -> None:
+            nonlocal idle_flush
+            if idle_flush is not None:
+                idle_flush.cancel()
+                idle_flush = None
+            eof = False
+            drained = False
+            for _ in range(PTY_READS_PER_WAKE):
                 try:
-                    chunk = await loop.run_in_executor(None, os.read, primary_fd, 1024)
-                except Exception:
+                    chunk = os.read(primary_fd, PTY_READ_SIZE)
+                except BlockingIOError:
+                    drained = True
+                    break
+                except OSError:
+                    # EIO once every holder of the secondary side has exited
+                    eof = True
                     break
                 if not chunk:
+                    eof = True
                     break
-                text = chunk.decode(errors="replace")
-                for line in text.splitlines():
-                    await self.log_queue.put(f"[{tr.cfg.name}] │ {line}")
-        asyncio.create_task(pump())
+                pending.extend(chunk)
+            if eof:
+                loop.remove_reader(primary_fd)
+            # Only hand off complete lines unless the stream has ended or the
+            # partial line outgrew its limit; all lines from one wake go onto
+            # the queue as a single batch
+            end = pending.rfind(b"\n") + 1
+            if eof or len(pending) - end > PTY_LINE_LIMIT:
+                end = len(pending)
+            if end:
+                emit(end, eof)
+            # Output paused mid-line (typically a prompt): show it unless more
+            # bytes arrive shortly
+            if drained and pending and not paused():
+                idle_flush = loop.call_later(PTY_IDLE_FLUSH, flush_tail)
+        loop.add_reader(primary_fd, on_readable)
 
         # handle ready detection
         if tr.cfg.kind is Kind.SERVICE and tr.cfg.ready_cmd:
             try:
                 await asyncio.wait_for(self._probe_ready(tr), READY_TIMEOUT)
             except asyncio.TimeoutError:
-                tr.state = State.FAILED
-                await self.log_queue.put(f"[{tr.cfg.name}] READY TIMEOUT")
+                self._set_state(tr, State.FAILED)
+                await self.log_queue.put((tr.cfg.name, [" READY TIMEOUT"]))
         elif tr.cfg.kind in (Kind.SERVICE, Kind.DAEMON):
-            tr.state = State.READY
+            self._set_state(tr, State.READY)
             tr.ready.set()
 
         # wait for process completion
         if tr.cfg.kind is Kind.ONESHOT:
             code = await tr.proc.wait()
             tr.end_time = time.monotonic()
-            tr.state = State.READY if code == 0 else State.FAILED
+            self._set_state(tr, State.READY if code == 0 else State.FAILED)
             tr.ready.set()
         else:
             code = await tr.proc.wait()
             tr.end_time = time.monotonic()
             if code != 0:
-                tr.state = State.FAILED
+                self._set_state(tr, State.FAILED)
+            else:
+                # end_time alone changes the displayed duration
+                self.dirty.set()
+
+    def write_stdin(self, tr: TaskRt, data: bytes) -> None:
+        """Write to a task's PTY without blocking; leftovers flush when writable."""
+        if tr.stdin_pending:
+            # Preserve ordering behind input that is still waiting
+            tr.stdin_pending.extend(data)
+            return
+        try:
+            written = os.write(tr.pty_primary, data)
+        except BlockingIOError:
+            written = 0
+        if written < len(data):
+            tr.stdin_pending.extend(data[written:])
+            asyncio.get_running_loop().add_writer(tr.pty_primary, self._flush_stdin, tr)
+
+    def _flush_stdin(self, tr: TaskRt) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            written = os.write(tr.pty_primary, tr.stdin_pending)
+        except BlockingIOError:
+            return
+        except OSError:
+            # PTY went away; nothing left to deliver to
+            written = len(tr.stdin_pending)
+        del tr.stdin_pending[:written]
+        if not tr.stdin_pending:
+            loop.remove_writer(tr.pty_primary)
 
     async def _probe_ready(self, tr: TaskRt) -> None:
+        # Plain commands are exec'd directly; only shell syntax pays for bash
+        argv = _probe_argv(tr.cfg.ready_cmd)
+        delay = PROBE_INTERVAL_MIN
         while True:
-            proc = await asyncio.create_subprocess_shell(
-                tr.cfg.ready_cmd,
-                cwd=tr.cfg.workdir,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL,
-                executable="/bin/bash",
-                preexec_fn=_preexec,
-            )
-            if await proc.wait() == 0:
-                tr.state = State.READY
+            if argv is not None:
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *argv,
+                        cwd=tr.cfg.workdir,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL,
+                        preexec_fn=_preexec,
+                    )
+                except OSError:
+                    # Builtins (exit, source, cd), shebang-less scripts, ...:
+                    # only bash can run these, so use it for every later poll
+                    argv = None
+            if argv is None:
+                proc = await asyncio.create_subprocess_shell(
+                    tr.cfg.ready_cmd,
+                    cwd=tr.cfg.workdir,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    executable="/bin/bash",
+                    preexec_fn=_preexec,
+                )
+            code = await proc.wait()
+            if code == 0:
+                self._set_state(tr, State.READY)
                 tr.ready.set()
-                await self.log_queue.put(f"[{tr.cfg.name}] ready")
+                await self.log_queue.put((tr.cfg.name, [" ready"]))
                 return
-            await asyncio.sleep(0.5)
\ No newline at end of file
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PROBE_INTERVAL_MAX)